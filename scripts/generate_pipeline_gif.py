@@ -9,32 +9,75 @@ Usage:
         python scripts/generate_pipeline_gif.py --frames 3
         python scripts/generate_pipeline_gif.py --frames 60 --fps 15 --speed 2.0
         python scripts/generate_pipeline_gif.py --frames 60 --density 600 --scale 4
+        python scripts/generate_pipeline_gif.py --frames 60 --render-dpi 100 --gif-width 800
         python scripts/generate_pipeline_gif.py --frames 3 --output test.gif
+        python scripts/generate_pipeline_gif.py --frames 60 --jobs 4
 
 Requirements:
-- pdflatex (LaTeX distribution with standalone class)
-- Ghostscript (gs) - preferred for PDF to PNG conversion
-- ImageMagick (magick or convert) - required for GIF creation and fallback PDF conversion
+- pdflatex (LaTeX distribution with standalone class), or lualatex/xelatex via --engine
+- mylatexformat (optional) - precompiles the shared preamble for faster frames
+- Ghostscript (gs) - preferred for PDF to PNG conversion (single pass, no compositing)
+- ImageMagick (magick or convert) - required for fallback GIF creation and PDF conversion
+- Pillow (optional) - assembles the GIF in-process when gifski and FFmpeg are missing
+- gifski (optional) - preferred for GIF creation (high-quality multithreaded quantizer)
+- FFmpeg (optional) - used for GIF creation without gifski (palette-based, streams frames)
 - Python 3
 
 The script will:
 1. Generate multiple LaTeX frames with animated coin positions
-2. Compile each frame to PDF
+2. Compile the frames to PDF in batches, one page per frame (loading a
+   precompiled preamble if possible and including the static artwork, which
+   is pre-rendered once)
 3. Convert PDFs to PNG images (using Ghostscript if available, else ImageMagick)
-4. Combine PNGs into a GIF
+4. Combine PNGs into a GIF (using gifski or FFmpeg if available, else Pillow or ImageMagick)
+
+Frames are compiled as standalone documents rather than through
+TikZ externalization (\tikzexternalize): the precompiled preamble, the worker
+pool and the frame cache give the same savings (one preamble load, pictures
+compiled in parallel, unchanged pictures skipped) without -shell-escape or make.
 """
 
 import subprocess
 import shutil
 import sys
+import os
 import argparse
+import collections
+import functools
+import hashlib
+import random
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 
+try:
+    from PIL import Image  # Optional: in-process GIF assembly without ImageMagick
+except ImportError:
+    Image = None
+
 # Configuration
 NUM_FRAMES = 60  # Number of frames for smooth animation
 FPS = 15  # Frames per second for GIF
+DENSITY = 150  # Rasterization DPI; GIFs are viewed on screen, so 300 DPI is usually wasted
 TEX_DIR = Path("data/archive/data_deals-neurips_camera_ready-latex")
+PREAMBLE_FORMAT = "pipeline-preamble"  # Job name of the precompiled preamble (.fmt)
+# First line of documents compiled with the format. The engine is also given
+# -fmt; the line lets kept .tex files be recompiled by hand with a plain call.
+FORMAT_LINE = f"%&{PREAMBLE_FORMAT}\n"
+CACHE_DIR = TEX_DIR / ".frame_cache"  # Build artifacts reused across runs
+CACHE_VERSION = 1  # Bump when rendering changes in a way the frame source does not show
+LATEX_ENGINES = ['pdflatex', 'lualatex', 'xelatex']
+FRAME_BATCH_SIZE = 8  # Max frames per LaTeX document (and Ghostscript run)
+
+# ImageMagick PNG output settings. Compressed intermediate PNGs: zlib costs
+# little next to rasterization and keeps frames small for the GIF encoder
+PNG_DEFINES = [
+    '-define', 'png:compression-level=6',
+    '-define', 'png:compression-strategy=1',
+    '-define', 'png:exclude-chunk=all',
+]
 
 # Animation constants
 BASE_ANIMATION_SPEED = 0.05
@@ -43,26 +86,134 @@ HORIZONTAL_COIN_COUNT = 60
 PILE_COIN_MAX = 25
 VERTICAL_Y_START_ADJUST = 0.1
 
-def check_dependencies():
-    """Check if required tools are available."""
+# Template blocks rewritten per frame. Each loop pattern matches up to the
+# opening brace of the loop body; find_loop_span() finds its closing brace.
+MAIN_COIN_LOOP_RE = re.compile(r'^[ \t]*\\foreach \\j in \{12,\.\.\.,58\}[ \t]*\{', re.MULTILINE)
+OPENING_COIN_LOOP_RE = re.compile(r'^[ \t]*\\foreach \\j in \{1,\.\.\.,7\}[ \t]*\{', re.MULTILINE)
+# TeX tokens that matter for brace matching: escaped characters (\{, \}, \%),
+# comments, and braces
+BRACE_TOKEN_RE = re.compile(r'\\.|%[^\n]*|[{}]', re.DOTALL)
+# \drawCoinStreamVertical{x}{y}{count}{spacing}{angle1}{angle2}{seed}
+VERTICAL_STREAM_RE = re.compile(
+    r'^([ \t]*)\\drawCoinStreamVertical' + r'\{([^}]*)\}' * 7 + r'[^\n]*', re.MULTILINE
+)
+
+# Template landmarks used to split the static artwork into pre-rendered layers.
+# The setup runs from \begin{tikzpicture} through the last \pgfmathsetmacro of
+# the pipe centers; the vertical streams sit between each tube's \clip and the
+# first \draw of the tube itself.
+PICTURE_SETUP_RE = re.compile(
+    r'\\begin\{tikzpicture\}[ \t]*\n(.*?^[ \t]*\\pgfmathsetmacro\{\\centerD\}[^\n]*\n)', re.DOTALL | re.MULTILINE
+)
+TUBE_LOOP_RE = re.compile(r'^[ \t]*\\foreach \\i/\\centerX in ', re.MULTILINE)
+TUBE_STREAMS_RE = re.compile(
+    r'^[ \t]*\\clip[^\n]*\n(.*?)^(?=[ \t]*\\draw\[mydarkblue,opacity=0\.25)', re.DOTALL | re.MULTILINE
+)
+# Static layers in drawing order: below the main coins, between the main coins
+# and the vertical streams, and above the streams
+STATIC_LAYERS = ['static_back', 'static_mid', 'static_front']
+LAYER_CENTER_RE = re.compile(r'PIPELINE-LAYER-CENTER=(-?[\d.]+pt),(-?[\d.]+pt)')
+# Commands whose output is only correct after an earlier pass wrote the .aux file
+CROSS_REFERENCE_RE = re.compile(r'\\(?:label|ref|pageref|eqref|cite|tableofcontents)\b')
+
+# A single coin, defined once in the frame preamble as the pic `coin` so that
+# each coin in a frame is one \pic call instead of six drawing commands
+# (its rim is a 0.6 x 0.12 half-ellipse, so 12 plot samples are as smooth as
+# 30 at GIF resolution)
+COIN_PIC_DEFINITION = r"""\tikzset{pics/coin/.style={code={
+  \fill[coinyellow] (-0.3,-0.03) arc[start angle=180, end angle=360, x radius=0.3, y radius=0.06] -- (0.3,0.03) arc[start angle=0, end angle=180, x radius=0.3, y radius=0.06] -- cycle;
+  \fill[coinyellow] (0,0.03) ellipse [x radius=0.3, y radius=0.06];
+  \draw[black,thick] (0,0.03) ellipse [x radius=0.3, y radius=0.06];
+  \draw[black,thick] plot[domain=pi:2*pi,samples=12] ({0.3*cos(\x r)}, {-0.03+0.06*sin(\x r)});
+  \draw[black,thick] (-0.3,-0.03) -- (-0.3,0.03);
+  \draw[black,thick] (0.3,-0.03) -- (0.3,0.03);
+}}}"""
+
+# A coin flowing after the clog or piled up at it, at a position precomputed in Python
+COIN_PIC_TEMPLATE = r"""      \pic[rotate={angle:.2f}] at ({x:.4f},{y:.4f}) {{coin}};"""
+
+# A coin of a vertical stream, at a position precomputed in Python and
+# indented like the \drawCoinStreamVertical line it replaces
+VERTICAL_COIN_TEMPLATE = r"""{indent}\pic[rotate={angle:.2f}] at ({x:.4f},{y:.4f}) {{coin}};"""
+
+# Replacement for the template's static coin loop. Clog position:
+# clogX = xB - 0.18, clogW = 0.9.
+# Coins flow RIGHT TO LEFT (from xE toward xA) and the clog blocks the flow, so:
+# - NO coins can be LEFT of clog (between xA and clogX) - physically impossible
+# - Coins BACK UP on RIGHT side of clog (between clogX and xE, near clog)
+# - Coins FLOW AFTER clog (between clogX+clogW and xE)
+MAIN_COIN_BLOCK_TEMPLATE = r"""  % Animated coins flowing AFTER clog (frame {frame}/{total_frames}, progress={progress:.3f})
+{flowing_coins}
+  % Piled-up coins at clog (accumulated over time)
+{pile_coins}
+"""
+
+# A static layer compiled on its own. It reports the center of its bounding
+# box in the log, which is also the center of the PDF page standalone crops to.
+STATIC_LAYER_TEMPLATE = r"""\begin{{tikzpicture}}
+{setup}{body}
+  \path let \p1 = (current bounding box.center) in \pgfextra{{\typeout{{PIPELINE-LAYER-CENTER=\x1,\y1}}}};
+\end{{tikzpicture}}
+"""
+
+# Places a pre-rendered static layer back where it was drawn in the picture
+STATIC_INCLUDE_TEMPLATE = r"""  % Pre-rendered {name}.pdf (source {digest})
+  \node[inner sep=0pt, outer sep=0pt] at ({x},{y}) {{\includegraphics{{{name}.pdf}}}};
+"""
+
+# Pipeline geometry mirrored from broken_pipeline.tex, used to precompute coin positions
+PIPE_X_END = 13.0  # \xE = \L
+PIPE_RADIUS = 0.8  # \rA
+CLOG_X = PIPE_X_END / 4 - 0.18  # \clogX = \xB - 0.18
+CLOG_WIDTH = 0.9  # \clogW
+CLOG_END = CLOG_X + CLOG_WIDTH  # \clogEnd
+
+def find_tools(engine='pdflatex'):
+    """
+    Resolve the external tools once.
+    
+    Returns a dict of executable paths ('engine', 'gs', 'magick', 'ffmpeg', 'gifski'),
+    None for tools that are not installed. It is passed to the functions that
+    run them, so PATH is not searched again for every frame.
+    """
+    return {
+        'engine': shutil.which(engine),
+        'gs': shutil.which('gs'),
+        'magick': shutil.which('magick') or shutil.which('convert'),
+        'ffmpeg': shutil.which('ffmpeg'),
+        'gifski': shutil.which('gifski'),
+    }
+
+def check_dependencies(engine='pdflatex'):
+    """Check if required tools are available and return their paths (see find_tools)."""
+    tools = find_tools(engine)
     missing = []
     
-    # Required: pdflatex
-    if not shutil.which('pdflatex'):
-        missing.append('pdflatex (LaTeX compiler)')
+    # Required: LaTeX engine (pdflatex by default)
+    if not tools['engine']:
+        missing.append(f'{engine} (LaTeX compiler)')
     
     # Required: ImageMagick (for GIF creation and fallback PDF conversion)
-    if not (shutil.which('magick') or shutil.which('convert')):
+    if not tools['magick']:
         missing.append('magick or convert (ImageMagick)')
     
     # Optional but recommended: Ghostscript (better PDF rendering quality)
-    gs_available = shutil.which('gs')
-    if not gs_available:
+    if not tools['gs']:
         print("WARNING: Ghostscript (gs) not found. Will use ImageMagick for PDF conversion.")
         print("  For better quality, install: sudo apt-get install ghostscript")
     else:
         print("✓ Ghostscript found (will be used for PDF conversion)")
     
+    # Optional: gifski or FFmpeg (faster, lower-memory GIF encoding)
+    if tools['gifski']:
+        print("✓ gifski found (will be used for GIF creation)")
+    elif tools['ffmpeg']:
+        print("✓ FFmpeg found (will be used for GIF creation)")
+    elif Image is not None:
+        print("NOTE: gifski/FFmpeg not found. Will use Pillow for GIF creation.")
+    else:
+        print("NOTE: gifski/FFmpeg not found. Will use ImageMagick for GIF creation.")
+    
     if missing:
         print("ERROR: Missing required tools:")
         for tool in missing:
@@ -71,41 +222,205 @@ def check_dependencies():
         print("  - LaTeX: sudo apt-get install texlive-full")
         print("  - ImageMagick: sudo apt-get install imagemagick")
         print("  - Ghostscript: sudo apt-get install ghostscript (recommended)")
+        print("  - FFmpeg: sudo apt-get install ffmpeg (recommended)")
+        print("  - gifski: cargo install gifski (optional)")
         sys.exit(1)
     
     print("✓ All required dependencies found")
+    return tools
+
+# Template sources handed to worker processes by init_worker(), keyed by name
+WORKER_SOURCES = {}
+
+def init_worker(template, tikz_imports):
+    """
+    Give a frame worker process the sources already read by the main process.
+    
+    Workers then never read or clean the .tex files themselves, whether the
+    pool forks or spawns them.
+    """
+    WORKER_SOURCES['template'] = template
+    WORKER_SOURCES['tikz_imports'] = tikz_imports
 
+@functools.lru_cache(maxsize=1)
 def read_template():
-    """Read the original broken_pipeline.tex file."""
+    """
+    Read the original broken_pipeline.tex file.
+    
+    The template is identical for every frame, so it is read once per process
+    (on first use, not at import) and cached. Worker processes use the copy
+    from init_worker().
+    """
+    if 'template' in WORKER_SOURCES:
+        return WORKER_SOURCES['template']
     template_path = TEX_DIR / "figs" / "broken_pipeline.tex"
     with open(template_path, 'r') as f:
         return f.read()
 
-def get_coin_drawing_code():
-    """Return TikZ code for drawing a single coin."""
+def clean_tikz_imports(tikz_imports):
+    """Comment out optional packages in tikz_imports.tex that broken_pipeline.tex does not use."""
+    return tikz_imports.replace(
+        '\\usepackage[outline]{contour} %',
+        '% \\usepackage[outline]{contour} % Optional, not used in broken_pipeline'
+    ).replace(
+        '\\contourlength{1.1pt}',
+        '% \\contourlength{1.1pt} % Optional'
+    ).replace(
+        '\\usepackage{physics}',
+        '% \\usepackage{physics} % Optional, not used in broken_pipeline'
+    )
+
+@functools.lru_cache(maxsize=1)
+def read_tikz_imports():
+    """Read tikz_imports.tex (shared TikZ styles and macros) with optional packages removed, once per process."""
+    if 'tikz_imports' in WORKER_SOURCES:
+        return WORKER_SOURCES['tikz_imports']
+    tikz_imports_path = TEX_DIR / "tikz_imports.tex"
+    with open(tikz_imports_path, 'r') as f:
+        return clean_tikz_imports(f.read())
+
+@functools.lru_cache(maxsize=None)
+def get_coin_jitter(count, seed):
+    """
+    Return `count` (y, angle) pairs that scatter coins across the pipe.
+    
+    The seed is fixed, so every coin keeps the same jitter in every frame and
+    only its x position animates.
+    """
+    rng = random.Random(seed)
     return [
-        "        \\fill[coinyellow] (-0.3,-0.03) arc[start angle=180, end angle=360, x radius=0.3, y radius=0.06] -- (0.3,0.03) arc[start angle=0, end angle=180, x radius=0.3, y radius=0.06] -- cycle;",
-        "        \\fill[coinyellow] (0,0.03) ellipse [x radius=0.3, y radius=0.06];",
-        "        \\draw[black,thick] (0,0.03) ellipse [x radius=0.3, y radius=0.06];",
-        "        \\draw[black,thick] plot[domain=pi:2*pi,samples=30] ({0.3*cos(\\x r)}, {-0.03+0.06*sin(\\x r)});",
-        "        \\draw[black,thick] (-0.3,-0.03) -- (-0.3,0.03);",
-        "        \\draw[black,thick] (0.3,-0.03) -- (0.3,0.03);"
+        ((rng.random() - 0.5) * 1.4 * (PIPE_RADIUS - 0.08), (rng.random() - 0.5) * 40)
+        for _ in range(count)
     ]
 
-def skip_loop(lines, start_idx):
+def get_flowing_coin_positions(progress, animation_speed):
     """
-    Skip a LaTeX loop block by counting braces.
+    Compute the (x, y, angle) of each coin flowing after the clog.
     
-    Returns the index after the closing brace of the loop.
+    Coins are spread evenly from the clog to the pipe opening and shifted right
+    to left by the animation progress. Evaluating this in Python lets the frame
+    contain literal coordinates instead of per-coin \\pgfmathsetmacro calls.
     """
-    i = start_idx + 1
-    brace_count = 1
-    while i < len(lines) and brace_count > 0:
-        line = lines[i]
-        brace_count += line.count('{')
-        brace_count -= line.count('}')
-        i += 1
-    return i
+    flow_start = CLOG_END
+    flow_end = PIPE_X_END - 0.5  # Skip the opening area
+    anim_offset = -progress * animation_speed * (PIPE_X_END - CLOG_END)
+    jitter = get_coin_jitter(HORIZONTAL_COIN_COUNT + 1, 42)
+    
+    positions = []
+    for j in range(HORIZONTAL_COIN_COUNT + 1):
+        base_x = flow_start + 0.3 + j * (flow_end - flow_start - 0.3) / HORIZONTAL_COIN_COUNT
+        coin_x = base_x + anim_offset
+        # If coin goes past the opening, wrap it back
+        if coin_x > flow_end:
+            coin_x = flow_start + (coin_x - flow_end) % (flow_end - flow_start)
+        # If coin reaches the clog, stop it there (pile up effect)
+        if coin_x < flow_start:
+            coin_x = flow_start + 0.05
+        coin_y, angle = jitter[j]
+        positions.append((coin_x, coin_y, angle))
+    return positions
+
+def get_pile_coin_positions(progress):
+    """
+    Compute the (x, y, angle) of each coin piled up against the clog.
+    
+    The pile grows with the animation progress, up to PILE_COIN_MAX coins
+    spread over 0.25 in front of the clog. The seed is fixed, so coins keep
+    their jitter as the pile grows.
+    """
+    pile_count = int(progress * PILE_COIN_MAX)
+    if pile_count <= 0:
+        return []
+    jitter = get_coin_jitter(pile_count + 1, 44)  # Different seed for pile-up coins
+    return [
+        (CLOG_END - 0.3 + k * 0.25 / pile_count, coin_y, angle)
+        for k, (coin_y, angle) in enumerate(jitter)
+    ]
+
+def build_main_coin_block(frame_num, total_frames, progress, animation_speed):
+    """Return the TikZ code that replaces the template's static coin loop."""
+    flowing_coins = '\n'.join(
+        COIN_PIC_TEMPLATE.format(x=coin_x, y=coin_y, angle=angle)
+        for coin_x, coin_y, angle in get_flowing_coin_positions(progress, animation_speed)
+    )
+    pile_coins = '\n'.join(
+        COIN_PIC_TEMPLATE.format(x=coin_x, y=coin_y, angle=angle)
+        for coin_x, coin_y, angle in get_pile_coin_positions(progress)
+    )
+    return MAIN_COIN_BLOCK_TEMPLATE.format(
+        frame=frame_num + 1,
+        total_frames=total_frames,
+        progress=progress,
+        flowing_coins=flowing_coins,
+        pile_coins=pile_coins
+    )
+
+def get_vertical_coin_positions(x, y, count, spacing, angle1, angle2, seed):
+    """
+    Compute the (x, y, angle) of each coin of a \\drawCoinStreamVertical stream.
+    
+    Mirrors the macro in tikz_imports.tex: coins are stacked `spacing` apart
+    downwards from `y`, with a small x jitter and an angle between `angle1`
+    and `angle2`. The seed is fixed, so the jitter is the same in every frame.
+    """
+    rng = random.Random(seed)
+    positions = []
+    for j in range(count + 1):
+        dx = (rng.random() - 0.5) * 0.08
+        angle = angle1 + rng.random() * (angle2 - angle1)
+        positions.append((x + dx, y - spacing * j, angle))
+    return positions
+
+def build_vertical_stream(match, frame_num, total_frames, progress, vertical_animation_speed):
+    """Return the animated replacement for a matched \\drawCoinStreamVertical line."""
+    indent_str, x_param, y_param, count_param, spacing_param, angle1_param, angle2_param, seed_param = match.groups()
+    
+    # Animate vertical position (coins fall down). Since coordinates are
+    # rotated 180deg, POSITIVE offset makes coins fall DOWN visually
+    adjusted_y = float(y_param) + VERTICAL_Y_START_ADJUST + progress * vertical_animation_speed
+    positions = get_vertical_coin_positions(
+        float(x_param), adjusted_y, int(count_param), float(spacing_param),
+        float(angle1_param), float(angle2_param), int(seed_param)
+    )
+    return '\n'.join(
+        [f"{indent_str}% Animated vertical coin stream (frame {frame_num + 1}/{total_frames})"] + [
+            VERTICAL_COIN_TEMPLATE.format(indent=indent_str, x=coin_x, y=coin_y, angle=angle)
+            for coin_x, coin_y, angle in positions
+        ]
+    )
+
+@functools.lru_cache(maxsize=4)
+def match_braces(tex_content):
+    """
+    Map the position of every opening brace in `tex_content` to its closing brace.
+    
+    The text is scanned once and the result cached, so the loop lookups made
+    for every frame cost a dict lookup. Unbalanced braces are left unmapped.
+    """
+    pairs = {}
+    stack = []
+    for token in BRACE_TOKEN_RE.finditer(tex_content):
+        if token.group() == '{':
+            stack.append(token.start())
+        elif token.group() == '}' and stack:
+            pairs[stack.pop()] = token.start()
+    return pairs
+
+def find_loop_span(tex_content, loop_re):
+    """
+    Return the (start, end) span of the loop matched by `loop_re`, or None.
+    
+    The span runs from the start of the \\foreach line through the closing
+    brace of the loop body and the rest of its line.
+    """
+    loop = loop_re.search(tex_content)
+    if not loop:
+        return None
+    close = match_braces(tex_content).get(loop.end() - 1)
+    if close is None:
+        return None
+    end = tex_content.find('\n', close)
+    return loop.start(), len(tex_content) if end == -1 else end + 1
 
 def create_animated_frame(tex_content, frame_num, total_frames, speed_factor=1.0):
     """
@@ -119,9 +434,6 @@ def create_animated_frame(tex_content, frame_num, total_frames, speed_factor=1.0
         total_frames: Total number of frames
         speed_factor: Speed multiplier (1.0 = default slow speed, 2.0 = 2x faster, 0.5 = 2x slower)
     """
-    lines = tex_content.split('\n')
-    animated_lines = []
-    
     # Calculate animation progress (0 to 1, looping)
     progress = (frame_num / total_frames) % 1.0
     
@@ -129,152 +441,138 @@ def create_animated_frame(tex_content, frame_num, total_frames, speed_factor=1.0
     animation_speed = BASE_ANIMATION_SPEED * speed_factor
     vertical_animation_speed = BASE_VERTICAL_ANIMATION_SPEED * speed_factor
     
-    coin_drawing = get_coin_drawing_code()
+    # Replace the main coin loop, and drop the coins at the pipe opening
+    # (\foreach \j in {1,...,7}) - these create artifacts
+    main_block = build_main_coin_block(frame_num, total_frames, progress, animation_speed)
+    rewrites = [(find_loop_span(tex_content, MAIN_COIN_LOOP_RE), main_block),
+                (find_loop_span(tex_content, OPENING_COIN_LOOP_RE), '')]
+    animated = tex_content
+    for span, replacement in sorted(((span, text) for span, text in rewrites if span), reverse=True):
+        animated = animated[:span[0]] + replacement + animated[span[1]:]
     
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        
-        # Replace the main coin loop
-        if r'\foreach \j in {12,...,58}' in line:
-            # Clog position: clogX = xB - 0.18, clogW = 0.9
-            # Coins flow RIGHT TO LEFT (from xE toward xA)
-            # Clog blocks flow, so:
-            # - NO coins can be LEFT of clog (between xA and clogX) - physically impossible
-            # - Coins BACK UP on RIGHT side of clog (between clogX and xE, near clog)
-            # - Coins FLOW AFTER clog (between clogX+clogW and xE)
-            
-            animated_lines.append("  \\def\\clogX{\\xB-0.18}")
-            animated_lines.append("  \\def\\clogW{0.9}")
-            animated_lines.append("  \\pgfmathsetmacro{\\clogEnd}{\\clogX + \\clogW}")
-            
-            # Add animated coins that FLOW AFTER the clog
-            animated_lines.append(f"  % Animated coins flowing AFTER clog (frame {frame_num + 1}/{total_frames}, progress={progress:.3f})")
-            animated_lines.append("  \\pgfmathsetseed{42}  % Fixed seed for consistent random positions")
-            animated_lines.append(f"  \\foreach \\j in {{0,...,{HORIZONTAL_COIN_COUNT}}} {{")
-            # Distribute coins evenly from clogEnd to xE-0.5 (skip opening area)
-            animated_lines.append("    \\pgfmathsetmacro{\\baseX}{\\clogEnd + 0.3 + \\j*(\\xE-0.5-\\clogEnd-0.3)/" + str(HORIZONTAL_COIN_COUNT) + "}")
-            # Move coins RIGHT TO LEFT (negative offset) based on progress
-            animated_lines.append(f"    \\pgfmathsetmacro{{\\animOffset}}{{-{progress} * {animation_speed} * (\\xE - \\clogEnd)}}")
-            animated_lines.append("    \\pgfmathsetmacro{\\coinx}{\\baseX + \\animOffset}")
-            # If coin goes past xE, wrap it back
-            animated_lines.append("    \\pgfmathparse{\\coinx > \\xE-0.5}")
-            animated_lines.append("    \\ifnum\\pgfmathresult=1")
-            animated_lines.append("      \\pgfmathsetmacro{\\excess}{\\coinx - (\\xE-0.5)}")
-            animated_lines.append("      \\pgfmathsetmacro{\\wrapDist}{mod(\\excess, \\xE-0.5 - \\clogEnd)}")
-            animated_lines.append("      \\pgfmathsetmacro{\\coinx}{\\clogEnd + \\wrapDist}")
-            animated_lines.append("    \\fi")
-            # If coin reaches clogEnd, stop it there (pile up effect)
-            animated_lines.append("    \\pgfmathparse{\\coinx < \\clogEnd}")
-            animated_lines.append("    \\ifnum\\pgfmathresult=1")
-            animated_lines.append("      \\pgfmathsetmacro{\\coinx}{\\clogEnd + 0.05}")
-            animated_lines.append("    \\fi")
-            # Only draw coins that are AFTER the clog and before the opening
-            animated_lines.append("    \\pgfmathparse{(\\coinx >= \\clogEnd) && (\\coinx <= \\xE-0.5) ? 1 : 0}")
-            animated_lines.append("    \\ifnum\\pgfmathresult=1")
-            animated_lines.append("      \\pgfmathsetmacro{\\coiny}{(rnd-0.5)*1.4*(\\rA-0.08)}")
-            animated_lines.append("      \\pgfmathsetmacro{\\angle}{(rnd-0.5)*40}")
-            animated_lines.append("      \\begin{scope}[shift={(\\coinx,\\coiny)}, rotate=\\angle]")
-            animated_lines.extend(coin_drawing)
-            animated_lines.append("      \\end{scope}")
-            animated_lines.append("    \\fi")
-            animated_lines.append("  }")
-            
-            # Add piled-up coins at the clog (accumulated coins that reached the clog)
-            animated_lines.append(f"  % Piled-up coins at clog (accumulated over time)")
-            animated_lines.append("  \\pgfmathsetseed{44}  % Different seed for pile-up coins")
-            animated_lines.append(f"  \\pgfmathsetmacro{{\\pileCount}}{{int({progress} * {PILE_COIN_MAX})}}")
-            animated_lines.append("  \\pgfmathparse{\\pileCount > 0 ? 1 : 0}")
-            animated_lines.append("  \\ifnum\\pgfmathresult=1")
-            animated_lines.append("    \\foreach \\k in {0,...,\\pileCount} {")
-            # Distribute piled coins just before the clog
-            animated_lines.append("      \\pgfmathsetmacro{\\pileX}{\\clogEnd - 0.3 + \\k*0.25/\\pileCount}")
-            animated_lines.append("      \\pgfmathsetmacro{\\pileY}{(rnd-0.5)*1.4*(\\rA-0.08)}")
-            animated_lines.append("      \\pgfmathsetmacro{\\pileAngle}{(rnd-0.5)*40}")
-            animated_lines.append("      \\begin{scope}[shift={(\\pileX,\\pileY)}, rotate=\\pileAngle]")
-            animated_lines.extend(coin_drawing)
-            animated_lines.append("      \\end{scope}")
-            animated_lines.append("    }")
-            animated_lines.append("  \\fi")
-            
-            # Skip the original loop
-            i = skip_loop(lines, i)
-            continue
-        
-        # Skip coins after the clog (second \foreach \j in {1,...,7}) - these create artifacts at opening
-        elif r'\foreach \j in {1,...,7}' in line and i > 100:  # Second occurrence (after clog)
-            i = skip_loop(lines, i)
-            continue
-        
-        # Animate vertical coin streams
-        elif r'\drawCoinStreamVertical{' in line:
-            # Extract the parameters and add animation offset
-            # Format: \drawCoinStreamVertical{x}{y}{count}{spacing}{angle1}{angle2}{seed}
-            parts = line.split('{')
-            if len(parts) >= 8:  # Need all 7 parameters plus the command
-                x_param = parts[1].split('}')[0]
-                y_param = parts[2].split('}')[0]
-                count_param = parts[3].split('}')[0]
-                spacing_param = parts[4].split('}')[0]
-                angle1_param = parts[5].split('}')[0]
-                angle2_param = parts[6].split('}')[0]
-                seed_param = parts[7].split('}')[0]
-                
-                # Animate vertical position (coins fall down)
-                indent = len(line) - len(line.lstrip())
-                indent_str = ' ' * indent
-                animated_lines.append(f"{indent_str}% Animated vertical coin stream (frame {frame_num + 1}/{total_frames})")
-                # Since coordinates are rotated 180deg, POSITIVE offset makes coins fall DOWN visually
-                animated_lines.append(f"{indent_str}\\pgfmathsetmacro{{\\animYOffset}}{{{progress} * {vertical_animation_speed} * 1.0}}")
-                animated_lines.append(f"{indent_str}\\pgfmathsetmacro{{\\adjustedY}}{{{y_param}+{VERTICAL_Y_START_ADJUST}+\\animYOffset}}")
-                animated_lines.append(f"{indent_str}\\drawCoinStreamVertical{{{x_param}}}{{\\adjustedY}}{{{count_param}}}{{{spacing_param}}}{{{angle1_param}}}{{{angle2_param}}}{{{seed_param}}}")
-            else:
-                animated_lines.append(line)
-            i += 1
-            continue
-        
-        animated_lines.append(line)
-        i += 1
+    # Animate vertical coin streams
+    return VERTICAL_STREAM_RE.sub(
+        lambda m: build_vertical_stream(m, frame_num, total_frames, progress, vertical_animation_speed),
+        animated
+    )
+
+@functools.lru_cache(maxsize=None)
+def split_template_layers(tex_content):
+    """
+    Split the template into its static artwork and the animated blocks between it.
+    
+    The coins are drawn between static parts of the picture (the main coins
+    over the pipe and under the clog, the vertical streams under the tubes), so
+    the static artwork is cut into one layer per gap. The vertical streams are
+    moved out of the tube loop into a loop of their own; each stream is clipped
+    to its own tube, so drawing them all before the tubes looks the same.
+    
+    Returns a dict with the shared 'setup' definitions, the 'static_back',
+    'static_mid' and 'static_front' layers, and the 'streams' loop, or None if
+    the template no longer has the expected structure. The result is cached,
+    so each worker process splits the template once; callers must not modify it.
+    """
+    setup = PICTURE_SETUP_RE.search(tex_content)
+    main_loop = find_loop_span(tex_content, MAIN_COIN_LOOP_RE)
+    tube_loop = TUBE_LOOP_RE.search(tex_content)
+    if not (setup and main_loop and tube_loop) or '\\end{tikzpicture}' not in tex_content:
+        return None
+    # The coins at the pipe opening are dropped from the animation (see create_animated_frame)
+    mid_start, mid_end = main_loop[1], tube_loop.start()
+    opening_loop = find_loop_span(tex_content, OPENING_COIN_LOOP_RE)
+    if opening_loop and mid_start <= opening_loop[0] and opening_loop[1] <= mid_end:
+        static_mid = tex_content[mid_start:opening_loop[0]] + tex_content[opening_loop[1]:mid_end]
+    else:
+        static_mid = tex_content[mid_start:mid_end]
+    
+    tail = tex_content[tube_loop.start():tex_content.rindex('\\end{tikzpicture}')]
+    streams = TUBE_STREAMS_RE.search(tail)
+    if not streams:
+        return None
     
-    return '\n'.join(animated_lines)
+    return {
+        'setup': setup.group(1),
+        'static_back': tex_content[setup.end():main_loop[0]],
+        'static_mid': static_mid,
+        'streams': tail[:streams.end(1)] + '    \\end{scope}\n  }\n',
+        'static_front': tail[:streams.start(1)] + tail[streams.end(1):],
+    }
 
-def create_frame_document(frame_content):
-    """Create a complete LaTeX document for a single frame."""
-    # Read tikz_imports to get all the necessary definitions
-    tikz_imports_path = TEX_DIR / "tikz_imports.tex"
-    with open(tikz_imports_path, 'r') as f:
-        tikz_imports = f.read()
+def create_layered_frame(layers, static_layers, frame_num, total_frames, speed_factor=1.0):
+    """
+    Build a frame that includes the pre-rendered static layers and draws only the coins.
     
-    # Remove optional packages that aren't used in broken_pipeline.tex
-    tikz_imports_clean = tikz_imports.replace(
-        '\\usepackage[outline]{contour} %',
-        '% \\usepackage[outline]{contour} % Optional, not used in broken_pipeline'
-    ).replace(
-        '\\contourlength{1.1pt}',
-        '% \\contourlength{1.1pt} % Optional'
-    ).replace(
-        '\\usepackage{physics}',
-        '% \\usepackage{physics} % Optional, not used in broken_pipeline'
+    Args:
+        layers: Template split by split_template_layers()
+        static_layers: {name: (x, y, digest)} from build_static_layers()
+        frame_num: Current frame number (0-indexed)
+        total_frames: Total number of frames
+        speed_factor: Speed multiplier (see create_animated_frame)
+    """
+    progress = (frame_num / total_frames) % 1.0
+    animation_speed = BASE_ANIMATION_SPEED * speed_factor
+    vertical_animation_speed = BASE_VERTICAL_ANIMATION_SPEED * speed_factor
+    
+    includes = {
+        name: STATIC_INCLUDE_TEMPLATE.format(name=name, x=x, y=y, digest=digest)
+        for name, (x, y, digest) in static_layers.items()
+    }
+    streams = VERTICAL_STREAM_RE.sub(
+        lambda m: build_vertical_stream(m, frame_num, total_frames, progress, vertical_animation_speed),
+        layers['streams']
     )
+    return ''.join([
+        '\\begin{tikzpicture}\n',
+        layers['setup'],
+        includes['static_back'],
+        build_main_coin_block(frame_num, total_frames, progress, animation_speed),
+        includes['static_mid'],
+        streams,
+        includes['static_front'],
+        '\\end{tikzpicture}\n',
+    ])
+
+def create_frame_document(frame_content, engine='pdflatex', background=True):
+    """
+    Create a complete LaTeX document for a single frame, or for a batch of frames
+    (the standalone class puts each tikzpicture on its own page).
     
-    # Add white background to tikzpicture
-    if '\\begin{tikzpicture}' in frame_content:
+    Static layers are built with background=False so the layers above the
+    bottom one stay transparent.
+    """
+    # Add white background to each tikzpicture (a batch document holds several)
+    if background and '\\begin{tikzpicture}' in frame_content:
         if '\\begin{tikzpicture}[' in frame_content:
             frame_content_with_bg = frame_content.replace(
                 '\\begin{tikzpicture}[',
-                '\\begin{tikzpicture}[background rectangle/.style={fill=white}, show background rectangle, ',
-                1
+                '\\begin{tikzpicture}[background rectangle/.style={fill=white}, show background rectangle, '
             )
         else:
             frame_content_with_bg = frame_content.replace(
                 '\\begin{tikzpicture}',
-                '\\begin{tikzpicture}[background rectangle/.style={fill=white}, show background rectangle]',
-                1
+                '\\begin{tikzpicture}[background rectangle/.style={fill=white}, show background rectangle]'
             )
     else:
         frame_content_with_bg = frame_content
     
-    standalone_doc = f"""\\documentclass[tikz]{{standalone}}
+    return f"""{frame_preamble(engine)}
+\\begin{{document}}
+{frame_content_with_bg}
+\\end{{document}}"""
+
+@functools.lru_cache(maxsize=None)
+def frame_preamble(engine='pdflatex'):
+    """
+    Return the preamble shared by every frame document, assembled once per engine.
+    
+    Under LuaLaTeX the pgf luamath library is loaded so pgfmath expressions are
+    evaluated in Lua rather than with TeX's fixed-point macro arithmetic.
+    """
+    engine_setup = ""
+    if engine == 'lualatex':
+        engine_setup = "\\usepgflibrary{luamath}\n\\pgfkeys{/pgf/luamath=parser}\n"
+    
+    return f"""\\documentclass[tikz]{{standalone}}
 \\usepackage{{tikz}}
 % Contour package is optional - not used in broken_pipeline.tex
 % \\usepackage[outline]{{contour}}
@@ -284,220 +582,647 @@ def create_frame_document(frame_content):
 \\usetikzlibrary{{calc}}
 \\tikzset{{>=latex}}
 % \\contourlength{{1.1pt}}
+{engine_setup}
+{read_tikz_imports()}
+% The white background rectangle added to frames needs the backgrounds library;
+% tikz_imports.tex resets the layer list, so put its background layer back
+\\usetikzlibrary{{backgrounds}}
+\\pgfsetlayers{{background,back,main,foreground}}
+{COIN_PIC_DEFINITION}
+"""
 
-{tikz_imports_clean}
+def build_preamble_format(output_dir, use_cache=True, engine='pdflatex', engine_cmd=None):
+    """
+    Precompile the frame preamble into a LaTeX format file using mylatexformat.
+    
+    Every frame shares the same preamble (standalone class, TikZ libraries and
+    tikz_imports.tex), which dominates LaTeX runtime for a single picture.
+    Dumping it once lets each frame load it from PREAMBLE_FORMAT.fmt; mylatexformat
+    makes the frame documents skip their own preamble when loaded this way.
+    
+    The format is also kept in CACHE_DIR, keyed by the preamble and the engine
+    version, so later runs with an unchanged preamble skip the dump entirely.
+    
+    Returns True on success, False on failure (frames then compile without it).
+    """
+    engine_cmd = engine_cmd or engine
+    preamble_doc = create_frame_document("", engine)
+    format_file = output_dir / f"{PREAMBLE_FORMAT}.fmt"
+    
+    cached_format = None
+    if use_cache:
+        version = subprocess.run([engine_cmd, '--version'], capture_output=True).stdout
+        digest = hashlib.sha256(version + preamble_doc.encode()).hexdigest()
+        cached_format = CACHE_DIR / f"{PREAMBLE_FORMAT}-{digest[:16]}.fmt"
+        if cached_format.exists():
+            shutil.copy(cached_format, format_file)
+            return True
+    
+    preamble_tex = output_dir / f"{PREAMBLE_FORMAT}.tex"
+    with open(preamble_tex, 'w') as f:
+        f.write(preamble_doc)
+    
+    result = subprocess.run(
+        [engine_cmd, '-ini', '-interaction=batchmode', f'-jobname={PREAMBLE_FORMAT}',
+         f'&{engine}', 'mylatexformat.ltx', preamble_tex.name],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        cwd=str(output_dir)
+    )
+    if result.returncode != 0 or not format_file.exists():
+        return False
+    
+    if cached_format:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        copy_atomic(format_file, cached_format)
+    return True
 
-\\begin{{document}}
-{frame_content_with_bg}
-\\end{{document}}"""
+def run_quiet(cmd, **kwargs):
+    """
+    Run a command with its output discarded, rerunning it with output captured if it fails.
+    
+    Engine and converter output is only needed to diagnose failures, so the
+    common successful run does not pipe it into Python at all.
     
-    return standalone_doc
+    Returns the CompletedProcess; stdout/stderr are only set after a failure.
+    """
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+    if result.returncode != 0:
+        result = subprocess.run(cmd, capture_output=True, **kwargs)
+    return result
 
-def is_magick_v7(magick_cmd):
-    """Check if ImageMagick command is v7 (magick) or v6 (convert)."""
-    return 'magick' in magick_cmd or magick_cmd.endswith('/magick')
+def summarize_latex_errors(lines, max_lines=10):
+    """
+    Return the last `max_lines` error lines of LaTeX output, or its last lines if none.
+    
+    `lines` is consumed one line at a time (e.g. an open log file), so only
+    `max_lines` lines are held in memory however long the log is.
+    """
+    errors = collections.deque(maxlen=max_lines)
+    tail = collections.deque(maxlen=max_lines)
+    for line in lines:
+        line = line.rstrip('\n')
+        if 'Error' in line or '!' in line:
+            errors.append(line)
+        tail.append(line)
+    return '\n'.join(errors or tail)
+
+def latex_command(engine_cmd, use_preamble_format):
+    """Return the command line used to compile frames and static layers."""
+    latex_cmd = [engine_cmd, '-interaction=batchmode', '-no-shell-escape']
+    if use_preamble_format:
+        latex_cmd.append(f'-fmt={PREAMBLE_FORMAT}')
+    return latex_cmd
 
-def composite_with_white_background(input_png, output_png):
+def aux_digest(tex_file):
+    """Return a hash of the .aux file written for `tex_file`, or None if there is none."""
+    try:
+        return hashlib.sha256(tex_file.with_suffix('.aux').read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+def needs_rerun(tex_file, aux_before=None):
     """
-    Composite PNG with white background using ImageMagick.
+    Check whether a compiled document needs another LaTeX pass.
     
-    Returns True on success, False on failure.
+    It does if LaTeX asks for one in its log, or if the pass changed the .aux
+    file (`aux_before` being its aux_digest() from before the pass), since the
+    next pass would then read different labels or citations. Frames are plain
+    TikZ pictures without labels, citations or a TOC, so this is normally
+    False; it only guards against templates that start using them.
     """
-    magick_cmd = shutil.which('magick') or 'convert'
-    is_v7 = is_magick_v7(magick_cmd)
+    try:
+        log = tex_file.with_suffix('.log').read_bytes()
+    except OSError:
+        return False
+    if b'Rerun to get' in log or b'Label(s) may have changed' in log:
+        return True
+    return aux_before is not None and aux_digest(tex_file) != aux_before
+
+def run_latex(latex_cmd, tex_file, body):
+    """
+    Compile `tex_file` with `latex_cmd` (which ends with its file name) in its directory.
     
-    if is_v7:
-        result = subprocess.run(
-            [magick_cmd, str(input_png),
-             '-background', 'white',
-             '-alpha', 'remove',
-             '-alpha', 'off',
-             '-define', 'png:compression-level=0',
-             '-define', 'png:compression-strategy=0',
-             str(output_png)],
-            capture_output=True
+    One pass is normally enough. If the document `body` uses cross-references,
+    a draft pass (-draftmode, or -no-pdf for XeTeX, which lacks -draftmode)
+    first writes the .aux file without the cost of producing a PDF, so a
+    single final pass normally follows; it is repeated once more only if
+    needs_rerun() finds that pass changed the .aux file or LaTeX asks for
+    another run.
+    
+    Returns the CompletedProcess of the last run.
+    """
+    cwd = str(tex_file.parent)
+    aux_before = None
+    if CROSS_REFERENCE_RE.search(body):
+        draft_flag = '-no-pdf' if Path(latex_cmd[0]).name.startswith('xelatex') else '-draftmode'
+        subprocess.run(
+            latex_cmd[:1] + [draft_flag] + latex_cmd[1:],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=cwd
         )
-    else:
+        aux_before = aux_digest(tex_file)
+    for _ in range(2):
         result = subprocess.run(
-            [magick_cmd, '-background', 'white', '-alpha', 'remove', '-alpha', 'off',
-             '-define', 'png:compression-level=0',
-             '-define', 'png:compression-strategy=0',
-             str(input_png), str(output_png)],
-            capture_output=True
+            latex_cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=cwd
         )
+        if not (tex_file.with_suffix('.pdf').exists() and needs_rerun(tex_file, aux_before)):
+            break
+        if aux_before is not None:
+            aux_before = aux_digest(tex_file)
+    return result
+
+def build_static_layers(output_dir, use_preamble_format=False, engine='pdflatex', engine_cmd=None,
+                        use_cache=True):
+    """
+    Compile the static artwork of the picture once, as one PDF per layer.
     
-    if result.returncode != 0:
-        print(f"ERROR (composite)")
-        print(result.stderr.decode()[-500:])
-        return False
-    return True
+    The pipe, clog, tubes, bowls and labels are identical in every frame, so
+    frames include these PDFs and only draw the coins themselves.
+    
+    Each layer PDF and its center are also kept in CACHE_DIR, keyed by the
+    layer document and the engine, so later runs with an unchanged template
+    skip compiling them.
+    
+    Returns {name: (x, y, digest)} giving where each layer is centered in the
+    picture and a hash of its source, or None if the layers could not be built
+    (frames are then drawn in full).
+    """
+    layers = split_template_layers(read_template())
+    if layers is None:
+        return None
+    engine_cmd = engine_cmd or engine
+    
+    def build_layer(name):
+        picture = STATIC_LAYER_TEMPLATE.format(setup=layers['setup'], body=layers[name])
+        doc_content = create_frame_document(picture, engine, background=False)
+        digest = hashlib.sha256(doc_content.encode()).hexdigest()[:16]
+        layer_pdf = output_dir / f"{name}.pdf"
+        
+        cached_pdf = None
+        if use_cache:
+            key = hashlib.sha256(f"{CACHE_VERSION}\n{engine}\n{doc_content}".encode()).hexdigest()
+            cached_pdf = CACHE_DIR / f"{name}-{key[:16]}.pdf"
+            cached_center = cached_pdf.with_suffix('.center')
+            # The PDF is cached after its center, so a cached PDF has one
+            if cached_pdf.exists():
+                try:
+                    x, y = cached_center.read_text().split(',')
+                    shutil.copy(cached_pdf, layer_pdf)
+                    return x, y, digest
+                except (OSError, ValueError):
+                    pass
+        
+        layer_tex = output_dir / f"{name}.tex"
+        with open(layer_tex, 'w') as f:
+            f.write((FORMAT_LINE if use_preamble_format else '') + doc_content)
+        # Output left over from an earlier run must not pass for this one
+        for stale in (layer_pdf, layer_tex.with_suffix('.log')):
+            try:
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+        run_latex(latex_command(engine_cmd, use_preamble_format) + [layer_tex.name], layer_tex, picture)
+        try:
+            center = LAYER_CENTER_RE.search(layer_tex.with_suffix('.log').read_text(errors='replace'))
+        except OSError:
+            return None
+        if not center or not layer_pdf.exists():
+            return None
+        
+        if cached_pdf:
+            try:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                center_tmp = output_dir / f"{name}.center"
+                center_tmp.write_text(f"{center.group(1)},{center.group(2)}")
+                copy_atomic(center_tmp, cached_center)
+                copy_atomic(layer_pdf, cached_pdf)
+            except OSError:
+                pass
+        return center.group(1), center.group(2), digest
+    
+    with ThreadPoolExecutor(max_workers=len(STATIC_LAYERS)) as executor:
+        results = list(executor.map(build_layer, STATIC_LAYERS))
+    if None in results:
+        return None
+    return dict(zip(STATIC_LAYERS, results))
 
-def convert_pdf_to_png_ghostscript(pdf_file, png_file, density):
+def is_magick_v7(magick_cmd):
+    """Check if ImageMagick command is v7 (magick) or v6 (convert)."""
+    return os.path.basename(magick_cmd).startswith('magick')
+
+def ghostscript_args(density, threads=1):
+    """
+    Return the PNG rendering options shared by every Ghostscript call.
+    
+    With threads > 1, Ghostscript renders the bands of a page in parallel.
+    """
+    return [
+        '-dNOPAUSE', '-dBATCH', '-dQUIET',
+        '-sDEVICE=png16m',  # 24-bit RGB PNG, no alpha
+        f'-r{density}',  # Resolution in DPI
+        '-dGraphicsAlphaBits=4',  # Anti-aliasing
+        '-dTextAlphaBits=4',  # Text anti-aliasing
+        f'-dNumRenderingThreads={threads}',
+    ]
+
+def convert_pdf_to_png_ghostscript(pdf_file, png_file, density, gs_cmd, page=None, threads=1):
     """
     Convert PDF to PNG using Ghostscript.
     
+    png16m output has no alpha channel and the frame PDF already has a white
+    background rectangle, so the PNG is written directly without a separate
+    ImageMagick compositing pass. `page` selects a page (0-indexed) of a
+    multi-page PDF.
+    
     Returns True on success, False on failure.
     """
-    gs_cmd = shutil.which('gs')
     if not gs_cmd:
         return False
     
-    temp_png = pdf_file.parent / f"{pdf_file.stem}_gs_temp.png"
-    
-    result = subprocess.run(
+    page_args = [f'-dFirstPage={page + 1}', f'-dLastPage={page + 1}'] if page is not None else []
+    # Ghostscript exits 0 when asked for a page the PDF does not have, so
+    # success is judged by the PNG being written (not left from an earlier run)
+    try:
+        png_file.unlink()
+    except FileNotFoundError:
+        pass
+    result = run_quiet(
         [gs_cmd,
-         '-dNOPAUSE', '-dBATCH', '-dQUIET',
-         '-sDEVICE=png16m',  # 16-bit RGB PNG
-         f'-r{density}',  # Resolution in DPI
-         '-dGraphicsAlphaBits=4',  # Anti-aliasing
-         '-dTextAlphaBits=4',  # Text anti-aliasing
-         f'-sOutputFile={temp_png}',
-         str(pdf_file)],
-        capture_output=True
+         *ghostscript_args(density, threads),
+         *page_args,
+         f'-sOutputFile={png_file}',
+         str(pdf_file)]
     )
     
     if result.returncode != 0:
         print(f"ERROR (Ghostscript)")
         print(result.stderr.decode()[-500:])
         return False
-    
-    # Composite with white background
-    success = composite_with_white_background(temp_png, png_file)
-    
-    # Clean up temp file
-    try:
-        temp_png.unlink()
-    except:
-        pass
-    
-    return success
+    return png_file.exists()
 
-def convert_pdf_to_png_imagemagick(pdf_file, png_file, density):
+def convert_pdf_to_png_imagemagick(pdf_file, png_file, density, magick_cmd, page=None):
     """
-    Convert PDF to PNG using ImageMagick.
+    Convert PDF to PNG using ImageMagick. `page` selects a page (0-indexed) of a
+    multi-page PDF.
     
     Returns True on success, False on failure.
     """
-    magick_cmd = shutil.which('magick') or 'convert'
+    magick_cmd = magick_cmd or 'convert'
     is_v7 = is_magick_v7(magick_cmd)
+    pdf_input = f"{pdf_file}[{page}]" if page is not None else str(pdf_file)
+    try:
+        png_file.unlink()
+    except FileNotFoundError:
+        pass
     
     if is_v7:
-        result = subprocess.run(
-            [magick_cmd, str(pdf_file),
+        result = run_quiet(
+            [magick_cmd, pdf_input,
              '-density', str(density),
              '-background', 'white',
              '-alpha', 'remove',
              '-alpha', 'off',
-             '-define', 'png:compression-level=0',
-             '-define', 'png:compression-strategy=0',
-             str(png_file)],
-            capture_output=True
+             *PNG_DEFINES,
+             str(png_file)]
         )
     else:
-        result = subprocess.run(
+        result = run_quiet(
             [magick_cmd, '-density', str(density),
              '-background', 'white', '-alpha', 'remove', '-alpha', 'off',
-             '-define', 'png:compression-level=0',
-             '-define', 'png:compression-strategy=0',
-             str(pdf_file), str(png_file)],
-            capture_output=True
+             *PNG_DEFINES,
+             pdf_input, str(png_file)]
         )
     
     if result.returncode != 0:
         print(f"ERROR")
         print(result.stderr.decode()[-500:])
         return False
-    return True
+    return png_file.exists()
+
+def convert_pdf_to_png(pdf_file, png_file, density, tools, page=None, threads=1):
+    """
+    Convert a single PDF (or one page of it) to PNG, trying Ghostscript first
+    (better quality) and falling back to ImageMagick.
+    
+    Returns the rasterizer that produced the PNG ('gs' or 'magick'), or None on failure.
+    """
+    if convert_pdf_to_png_ghostscript(pdf_file, png_file, density, tools['gs'], page, threads):
+        return 'gs'
+    if convert_pdf_to_png_imagemagick(pdf_file, png_file, density, tools['magick'], page):
+        return 'magick'
+    return None
 
-def compile_frame(frame_num, total_frames, output_dir, speed_factor=1.0, density=300, scale=1.0):
+def rasterize_pdf_ghostscript(pdf_name, frame_nums, output_dir, density, gs_cmd, threads=1):
+    """
+    Convert a batch PDF to one PNG per frame with a single Ghostscript process.
+    
+    Page k of the PDF holds frame_nums[k]. Ghostscript numbers the output pages
+    consecutively, so interpreter and font start-up is paid once per batch
+    instead of once per frame.
+    
+    Returns the list of frame numbers whose PNG could not be produced.
     """
-    Generate and compile a single frame.
+    if not gs_cmd:
+        return list(frame_nums)
+    
+    prefix = Path(pdf_name).stem
+    # Page PNGs left by an earlier run must not stand in for missing pages
+    for stale in output_dir.glob(f"{prefix}_page_*.png"):
+        try:
+            stale.unlink()
+        except OSError:
+            pass
+    result = subprocess.run(
+        [gs_cmd,
+         *ghostscript_args(density, threads),
+         f'-sOutputFile={prefix}_page_%04d.png',
+         pdf_name],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        cwd=str(output_dir)
+    )
+    if result.returncode != 0:
+        return list(frame_nums)
+    
+    # Ghostscript numbers pages from 1; map them back to frames
+    failed = []
+    for page, frame_num in enumerate(frame_nums, start=1):
+        page_png = output_dir / f"{prefix}_page_{page:04d}.png"
+        if page_png.exists():
+            page_png.replace(output_dir / f"frame_{frame_num:04d}.png")
+        else:
+            failed.append(frame_num)
+    return failed
+
+def copy_atomic(src, dst):
+    """Copy src to dst through a temporary file, so readers never see a partial dst."""
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+    shutil.copy(src, tmp)
+    os.replace(tmp, dst)
+
+def frame_cache_path(doc_content, engine, density, rasterizer):
+    """
+    Return where the PNG rendered from `doc_content` is cached.
+    
+    The key includes the rasterizer ('gs' or 'magick'), as Ghostscript and
+    ImageMagick do not produce identical PNGs. Entries are sharded by the first two hex digits of the key's SHA-256 so no
+    single directory collects every frame ever rendered.
+    """
+    key = f"{CACHE_VERSION}\n{engine}\n{density}\n{rasterizer}\n{doc_content}"
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return CACHE_DIR / digest[:2] / digest / "frame.png"
+
+def cache_frame_png(png_file, cached_png):
+    """Store a freshly rendered frame PNG at its CACHE_DIR path from frame_cache_path()."""
+    try:
+        cached_png.parent.mkdir(parents=True, exist_ok=True)
+        copy_atomic(png_file, cached_png)
+    except OSError:
+        pass
+
+def frame_label(frame_num, total_frames):
+    """Return the progress label printed for a frame."""
+    return f"Frame {frame_num + 1:3d}/{total_frames}..."
+
+def compile_frames(frame_nums, total_frames, output_dir, speed_factor=1.0, density=DENSITY, scale=1.0,
+                   use_preamble_format=False, rasterize=True, engine='pdflatex', use_cache=False,
+                   static_layers=None, tools=None):
+    """
+    Generate a batch of frames and compile them as the pages of one document.
+    
+    One LaTeX run writes frames_NNNN.pdf (NNNN being the batch's first frame)
+    with a page per frame, so engine start-up is paid once per batch rather
+    than once per frame. Frames found in the cache are left out of the document.
     
     Args:
-        frame_num: Frame number (0-indexed)
+        frame_nums: Frame numbers (0-indexed) in this batch
         total_frames: Total number of frames
         output_dir: Output directory for frames
         speed_factor: Animation speed multiplier
-        density: DPI/resolution for PNG conversion (default: 300)
+        density: DPI/resolution for PNG conversion (default: DENSITY)
         scale: Scale factor for output size (default: 1.0, use 0.5 for 50% size, 2.0 for 200% size)
+        use_preamble_format: Load the precompiled preamble from build_preamble_format()
+        rasterize: Convert the pages to PNG here; False leaves it to rasterize_pdf_ghostscript()
+        engine: LaTeX engine used to compile the frames (pdflatex, lualatex or xelatex)
+        use_cache: Reuse the PNG from CACHE_DIR when a frame's LaTeX source is unchanged
+        static_layers: Pre-rendered layers from build_static_layers(); None draws the full picture
+        tools: Tool paths from check_dependencies(); resolved here if not given
+    
+    Returns (reports, pdf_name, pages):
+        reports: (frame_num, success, report) for each frame. The reports are
+            printed by the caller, so output from parallel batches is not interleaved.
+        pdf_name: The batch PDF still to be rasterized, or None
+        pages: (frame_num, cached_png) for each page of that PDF, cached_png
+            being where to cache the frame's PNG (None without use_cache)
     """
-    print(f"Frame {frame_num + 1:3d}/{total_frames}...", end=" ", flush=True)
+    tools = tools or find_tools(engine)
+    # Calculate effective density (render at final resolution to avoid upscaling blur)
+    effective_density = int(density * scale)
+    # Frames are cached as rendered by the preferred rasterizer only
+    rasterizer = 'gs' if tools['gs'] else 'magick'
     
-    # Read template
-    template = read_template()
+    reports = []
+    pictures = []
+    pages = []
+    for frame_num in frame_nums:
+        # Create animated version
+        if static_layers:
+            picture = create_layered_frame(
+                split_template_layers(read_template()), static_layers, frame_num, total_frames, speed_factor
+            )
+        else:
+            picture = create_animated_frame(read_template(), frame_num, total_frames, speed_factor)
+        
+        # Unchanged frame source: reuse the PNG rendered by a previous run. The
+        # key is the document the frame would compile to on its own.
+        cached_png = None
+        if use_cache:
+            cached_png = frame_cache_path(create_frame_document(picture, engine), engine, effective_density, rasterizer)
+            if cached_png.exists():
+                shutil.copy(cached_png, output_dir / f"frame_{frame_num:04d}.png")
+                reports.append((frame_num, True, f"{frame_label(frame_num, total_frames)} ✓ (cached)"))
+                continue
+        pictures.append(f"% Frame {frame_num + 1}/{total_frames}\n{picture}")
+        pages.append((frame_num, cached_png))
     
-    # Create animated version
-    animated_content = create_animated_frame(template, frame_num, total_frames, speed_factor)
+    if not pages:
+        return reports, None, []
     
-    # Create standalone document
-    doc_content = create_frame_document(animated_content)
+    # Write the batch LaTeX file
+    batch_tex = output_dir / f"frames_{frame_nums[0]:04d}.tex"
+    pdf_file = batch_tex.with_suffix('.pdf')
+    body = '\n'.join(pictures)
+    with open(batch_tex, 'w') as f:
+        f.write((FORMAT_LINE if use_preamble_format else '') + create_frame_document(body, engine))
     
-    # Write frame LaTeX file
-    frame_tex = output_dir / f"frame_{frame_num:04d}.tex"
-    with open(frame_tex, 'w') as f:
-        f.write(doc_content)
+    # Compile to PDF. A single pass is enough: the standalone frames have no
+    # cross-references, TOC or bibliography (run_latex() adds passes if they do).
+    # batchmode keeps the engine quiet; diagnostics are read from the .log file,
+    # so the engine's terminal output is discarded.
+    # A PDF left over from an earlier run in the same work directory must not
+    # pass for this batch's output, so any PDF found afterwards is this run's
+    latex_cmd = latex_command(tools['engine'] or engine, use_preamble_format) + [batch_tex.name]
+    try:
+        pdf_file.unlink()
+    except FileNotFoundError:
+        pass
+    result = run_latex(latex_cmd, batch_tex, body)
+    if result.returncode != 0 and not pdf_file.exists():
+        log_file = batch_tex.with_suffix('.log')
+        try:
+            with open(log_file, errors='replace') as log:
+                error_msg = summarize_latex_errors(log)
+        except OSError:
+            # No log to read: rerun the failing batch to capture its output
+            result = subprocess.run(latex_cmd, capture_output=True, cwd=str(output_dir))
+            error_output = result.stdout.decode(errors='replace') + result.stderr.decode(errors='replace')
+            error_msg = summarize_latex_errors(error_output.splitlines())
+        # The error is reported once, with the batch's first uncached frame
+        for k, (frame_num, _) in enumerate(pages):
+            details = f"\n{error_msg}" if k == 0 else f" (in {batch_tex.name})"
+            reports.append((frame_num, False, f"{frame_label(frame_num, total_frames)} ERROR{details}"))
+        return sorted(reports), None, []
+    if result.returncode != 0:
+        # LaTeX recovered from an error and still wrote pages: use them for
+        # this run, but do not cache what may be a damaged rendering
+        pages = [(frame_num, None) for frame_num, _ in pages]
     
-    # Compile to PDF (run twice for proper references)
-    frame_filename = frame_tex.name
-    for run in [1, 2]:
-        result = subprocess.run(
-            ['pdflatex', '-interaction=nonstopmode', frame_filename],
-            capture_output=True,
-            cwd=str(output_dir)
-        )
-        if result.returncode != 0:
-            pdf_file = output_dir / f"frame_{frame_num:04d}.pdf"
-            if not pdf_file.exists() and run == 2:
-                print(f"ERROR")
-                error_output = result.stdout.decode() + result.stderr.decode()
-                error_lines = error_output.split('\n')
-                error_msg = '\n'.join([line for line in error_lines if 'Error' in line or '!' in line][-10:])
-                if error_msg:
-                    print(error_msg)
-                else:
-                    print(error_output[-500:])
-                return False
-    
-    # Convert PDF to PNG
-    pdf_file = output_dir / f"frame_{frame_num:04d}.pdf"
-    png_file = output_dir / f"frame_{frame_num:04d}.png"
+    # Convert each page to PNG
+    if rasterize:
+        for page, (frame_num, cached_png) in enumerate(pages):
+            png_file = output_dir / f"frame_{frame_num:04d}.png"
+            used = convert_pdf_to_png(pdf_file, png_file, effective_density, tools, page)
+            if not used:
+                reports.append((frame_num, False, f"{frame_label(frame_num, total_frames)} ERROR (rasterization)"))
+                continue
+            if cached_png and used == rasterizer:
+                cache_frame_png(png_file, cached_png)
+            reports.append((frame_num, True, f"{frame_label(frame_num, total_frames)} ✓"))
+        return sorted(reports), None, []
     
-    # Calculate effective density (render at final resolution to avoid upscaling blur)
-    effective_density = int(density * scale)
+    reports += [(frame_num, True, f"{frame_label(frame_num, total_frames)} ✓") for frame_num, _ in pages]
+    return sorted(reports), pdf_file.name, pages
+
+def create_gif_ffmpeg(num_frames, output_gif_path, fps, output_dir, ffmpeg_cmd, gif_width=None):
+    """
+    Encode the first `num_frames` numbered frame PNGs into a GIF with FFmpeg using a generated palette.
+    
+    A single FFmpeg process splits the stream into a palettegen branch and a
+    paletteuse branch, so frames are streamed rather than all held in memory and
+    the GIF is better quantized than ImageMagick's default.
     
-    # Try Ghostscript first (better quality), fall back to ImageMagick
-    if not convert_pdf_to_png_ghostscript(pdf_file, png_file, effective_density):
-        if not convert_pdf_to_png_imagemagick(pdf_file, png_file, effective_density):
-            return False
+    Returns True on success, False on failure.
+    """
+    if not ffmpeg_cmd:
+        return False
     
-    print("✓")
+    resize = f"scale={gif_width}:-1:flags=lanczos," if gif_width else ""
+    # Ordered (Bayer) dithering keeps the flat fills stable from frame to frame,
+    # which also lets the GIF encoder reuse more of each previous frame
+    filter_graph = (
+        f"[0:v]{resize}split[s0][s1];[s0]palettegen=max_colors=256[p];"
+        "[s1][p]paletteuse=dither=bayer:bayer_scale=5"
+    )
+    
+    result = run_quiet(
+        [ffmpeg_cmd, '-y', '-loglevel', 'error',
+         '-framerate', str(fps), '-start_number', '0', '-i', 'frame_%04d.png',
+         '-filter_complex', filter_graph, '-loop', '0',
+         # Stop at num_frames: numbered PNGs left in output_dir by a longer
+         # earlier run would otherwise be read too
+         '-frames:v', str(num_frames),
+         str(output_gif_path.resolve())],
+        cwd=str(output_dir)
+    )
+    
+    if result.returncode != 0:
+        print("ERROR creating GIF (FFmpeg)")
+        print(result.stderr.decode()[-500:])
+        return False
     return True
 
-def create_gif(num_frames, output_gif_path, fps, output_dir):
-    """Combine PNG frames into a GIF."""
-    print(f"\nCreating GIF from frames...")
+def create_gif_gifski(png_files, output_gif_path, fps, gifski_cmd, gif_width=None):
+    """
+    Encode PNG frames into a GIF with gifski.
     
-    # Collect PNG files
-    png_files = []
-    for i in range(num_frames):
-        png_file = output_dir / f"frame_{i:04d}.png"
-        if png_file.exists():
-            png_files.append(png_file)
-        else:
-            print(f"WARNING: Frame {i:04d}.png not found, skipping")
+    gifski quantizes frames in parallel with a per-frame palette search, which
+    gives smaller, cleaner GIFs than a single global palette.
     
-    if not png_files:
-        print("ERROR: No PNG files found!")
+    Returns True on success, False on failure.
+    """
+    if not gifski_cmd:
         return False
     
-    print(f"Found {len(png_files)} PNG files")
+    width_args = ['--width', str(gif_width)] if gif_width else []
+    result = run_quiet(
+        [gifski_cmd, '--quiet', '--fps', str(fps), *width_args,
+         '-o', str(output_gif_path.resolve())] +
+        [str(f.resolve()) for f in png_files]
+    )
+    
+    if result.returncode != 0:
+        print("ERROR creating GIF (gifski)")
+        print(result.stderr.decode()[-500:])
+        return False
+    return True
+
+def create_gif_pillow(png_files, output_gif_path, fps, gif_width=None):
+    """
+    Combine PNG frames into a GIF in-process with Pillow.
+    
+    Avoids starting an ImageMagick process. Pillow keeps every frame in memory
+    until the GIF is written, so unlike gifski and FFmpeg, memory use grows
+    with the number of frames.
+    
+    Returns True on success, False on failure (including Pillow not installed).
+    """
+    if Image is None:
+        return False
     
-    # Create GIF with ImageMagick
-    magick_cmd = shutil.which('magick') or 'convert'
+    def load_frame(png_file):
+        with Image.open(png_file) as frame:
+            frame = frame.convert('RGB')
+        if gif_width:
+            height = round(frame.height * gif_width / frame.width)
+            frame = frame.resize((gif_width, height), Image.LANCZOS)
+        return frame
+    
+    try:
+        first_frame = load_frame(png_files[0])
+        first_frame.save(
+            output_gif_path,
+            save_all=True,
+            append_images=(load_frame(f) for f in png_files[1:]),
+            duration=int(1000 / fps),
+            loop=0,
+            optimize=True
+        )
+    except (OSError, ValueError) as e:
+        print("ERROR creating GIF (Pillow)")
+        print(e)
+        return False
+    return True
+
+def create_gif_imagemagick(png_files, output_gif_path, fps, magick_cmd, gif_width=None):
+    """
+    Combine PNG frames into a GIF using ImageMagick.
+    
+    The frames are opaque, full-size PNGs, so no -coalesce pass is needed; it
+    would only decode every frame into memory at once.
+    
+    Returns True on success, False on failure.
+    """
+    magick_cmd = magick_cmd or 'convert'
     delay = int(100 / fps)  # Delay in 1/100 seconds
     
     png_files_abs = [str(f.resolve()) for f in png_files]
     output_gif_abs = str(output_gif_path.resolve())
+    resize_args = ['-resize', f'{gif_width}x'] if gif_width else []
     
     is_v7 = is_magick_v7(magick_cmd)
     if is_v7:
@@ -506,8 +1231,7 @@ def create_gif(num_frames, output_gif_path, fps, output_dir):
             '-delay', str(delay),
             '-loop', '0',
             '-dispose', 'none',  # Full frames to prevent flickering artifacts
-        ] + png_files_abs + [
-            '-coalesce',
+        ] + png_files_abs + resize_args + [
             '-layers', 'Optimize',  # Capitalized for v7
             output_gif_abs
         ]
@@ -517,16 +1241,48 @@ def create_gif(num_frames, output_gif_path, fps, output_dir):
             '-delay', str(delay),
             '-loop', '0',
             '-dispose', 'none',
-            '-coalesce',
             '-layers', 'optimize',  # Lowercase for v6
-        ] + png_files_abs + [output_gif_abs]
+        ] + png_files_abs + resize_args + [output_gif_abs]
     
-    result = subprocess.run(cmd, capture_output=True)
+    result = run_quiet(cmd)
     
     if result.returncode != 0:
         print("ERROR creating GIF")
         print(result.stderr.decode())
         return False
+    return True
+
+def create_gif(num_frames, output_gif_path, fps, output_dir, tools, gif_width=None):
+    """Combine PNG frames into a GIF, optionally resized to `gif_width` pixels wide."""
+    print(f"\nCreating GIF from frames...")
+    
+    # Collect PNG files
+    png_files = []
+    for i in range(num_frames):
+        png_file = output_dir / f"frame_{i:04d}.png"
+        if png_file.exists():
+            png_files.append(png_file)
+        else:
+            print(f"WARNING: Frame {i:04d}.png not found, skipping")
+    
+    if not png_files:
+        print("ERROR: No PNG files found!")
+        return False
+    
+    print(f"Found {len(png_files)} PNG files")
+    
+    # Prefer gifski, then FFmpeg (streaming palette encode); FFmpeg's
+    # frame_%04d.png input pattern needs a gap-free sequence, so fall back to
+    # Pillow (in-process) or ImageMagick when frames are missing
+    created = create_gif_gifski(png_files, output_gif_path, fps, tools['gifski'], gif_width)
+    if not created and tools['ffmpeg'] and len(png_files) == num_frames:
+        created = create_gif_ffmpeg(num_frames, output_gif_path, fps, output_dir, tools['ffmpeg'], gif_width)
+    if not created:
+        created = create_gif_pillow(png_files, output_gif_path, fps, gif_width)
+    if not created:
+        created = create_gif_imagemagick(png_files, output_gif_path, fps, tools['magick'], gif_width)
+    if not created:
+        return False
     
     size_mb = output_gif_path.stat().st_size / 1024 / 1024
     print(f"✓ GIF created: {output_gif_path}")
@@ -537,13 +1293,135 @@ def cleanup(output_dir):
     """Clean up intermediate files."""
     print("\nCleaning up intermediate files...")
     for ext in ['.tex', '.pdf', '.aux', '.log']:
-        for f in output_dir.glob(f"frame_*{ext}"):
+        for f in output_dir.glob(f"frames_*{ext}"):
             try:
                 f.unlink()
             except:
                 pass
+    for ext in ['.tex', '.fmt', '.log']:
+        try:
+            (output_dir / f"{PREAMBLE_FORMAT}{ext}").unlink()
+        except:
+            pass
+    for name in STATIC_LAYERS:
+        for ext in ['.tex', '.pdf', '.aux', '.log', '.center']:
+            try:
+                (output_dir / f"{name}{ext}").unlink()
+            except:
+                pass
     print("✓ Cleanup complete")
 
+def generate_frames(args, work_dir, tools):
+    """
+    Compile and rasterize all frames in work_dir with the tools from check_dependencies().
+    
+    Returns the list of frame numbers whose PNG was produced.
+    """
+    # Precompile the shared preamble once for all frames
+    use_preamble_format = build_preamble_format(
+        work_dir, use_cache=not args.no_cache, engine=args.engine, engine_cmd=tools['engine']
+    )
+    if use_preamble_format:
+        print(f"✓ Precompiled preamble: {PREAMBLE_FORMAT}.fmt")
+    else:
+        print("WARNING: Could not precompile preamble (mylatexformat missing?). Frames will load it individually.")
+    
+    # Render the static artwork once; frames then only draw the coins
+    static_layers = build_static_layers(
+        work_dir, use_preamble_format, args.engine, tools['engine'], use_cache=not args.no_cache
+    )
+    if static_layers:
+        print(f"✓ Pre-rendered static layers: {', '.join(static_layers)}")
+    else:
+        print("WARNING: Could not pre-render static layers. Frames will draw the full picture.")
+    
+    # Frames are compiled in batches, one multi-page document per batch, and
+    # the batches are spread across worker processes
+    jobs = args.jobs or os.cpu_count() or 1
+    batch_size = max(1, min(FRAME_BATCH_SIZE, -(-args.frames // jobs)))
+    batches = [list(range(k, min(k + batch_size, args.frames))) for k in range(0, args.frames, batch_size)]
+    # With Ghostscript available, batch PDFs are rasterized as they compile
+    batch_rasterize = tools['gs'] is not None
+    effective_density = int(args.density * args.scale)
+    # Up to `jobs` Ghostscript processes run at once; split the cores between them
+    gs_threads = max(1, (os.cpu_count() or 1) // jobs)
+    print(f"\nGenerating {args.frames} frames ({jobs} parallel jobs, {len(batches)} batches)...")
+    worker = functools.partial(
+        compile_frames,
+        total_frames=args.frames,
+        output_dir=work_dir,
+        speed_factor=args.speed,
+        density=args.density,
+        scale=args.scale,
+        use_preamble_format=use_preamble_format,
+        rasterize=not batch_rasterize,
+        engine=args.engine,
+        use_cache=not args.no_cache,
+        static_layers=static_layers,
+        tools=tools
+    )
+    # Each batch PDF is handed to Ghostscript as soon as it compiles, in
+    # completion order, so rasterization overlaps with the batches still in
+    # LaTeX and a slow batch does not hold back the ones submitted after it.
+    # Reports are still printed in frame order: each batch's reports wait
+    # until every earlier batch has been printed.
+    compiled = []
+    raster_jobs = []
+    batch_reports = {}
+    next_report = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(read_template(), read_tikz_imports())) as executor, \
+            ThreadPoolExecutor(max_workers=jobs) as rasterizer:
+        batch_jobs = {executor.submit(worker, batch): k for k, batch in enumerate(batches)}
+        for batch_job in as_completed(batch_jobs):
+            reports, pdf_name, pages = batch_job.result()
+            batch_reports[batch_jobs[batch_job]] = reports
+            while next_report in batch_reports:
+                for frame_num, ok, report in batch_reports.pop(next_report):
+                    print(report, flush=True)
+                    if ok:
+                        compiled.append(frame_num)
+                next_report += 1
+            if pdf_name:
+                frame_nums = [frame_num for frame_num, _ in pages]
+                raster_jobs.append((pdf_name, pages, rasterizer.submit(
+                    rasterize_pdf_ghostscript, pdf_name, frame_nums, work_dir, effective_density, tools['gs'],
+                    gs_threads
+                )))
+    
+    rasterized = 0
+    for pdf_name, pages, raster_job in raster_jobs:
+        failed = raster_job.result()
+        for page, (frame_num, cached_png) in enumerate(pages):
+            png_file = work_dir / f"frame_{frame_num:04d}.png"
+            # Fall back to converting the page on its own if the batch failed
+            used = 'gs'
+            if frame_num in failed:
+                used = convert_pdf_to_png(
+                    work_dir / pdf_name, png_file, effective_density, tools, page, os.cpu_count() or 1
+                )
+            if not used:
+                print(f"{frame_label(frame_num, args.frames)} ERROR (rasterization)")
+                compiled.remove(frame_num)
+                continue
+            rasterized += 1
+            # Only Ghostscript renderings are cached under the Ghostscript key
+            if cached_png and used == 'gs':
+                cache_frame_png(png_file, cached_png)
+    if raster_jobs:
+        print(f"✓ Rasterized {rasterized} frames with Ghostscript")
+    return sorted(compiled)
+
+def positive_int(value):
+    """argparse type for options that need an integer of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(
         description='Generate an animated GIF from the broken_pipeline.tex TikZ diagram',
@@ -552,11 +1430,18 @@ def main():
 Directory handling:
   - By default, creates a timestamped directory under TEX_DIR:
     data/archive/data_deals-neurips_camera_ready-latex/gif_frames_YYYYMMDD_HHMMSS/
-  - All frame files (.tex, .pdf, .png, .aux, .log) are written to the output directory
-  - The final GIF is written to the same output directory
+  - Intermediate files (.tex, .pdf, .aux, .log) are written to a work directory:
+    a temporary directory on /dev/shm (RAM) if available, removed afterwards,
+    else the output directory; use --work-dir to choose (and keep) it, or
+    --keep-intermediates to keep them in the output directory
+  - Frame PNGs and the final GIF are written to the output directory
   - Use --output-dir to specify a custom directory location
-  - pdflatex runs from the output directory as the working directory
+  - The LaTeX engine runs from the work directory as the working directory
   - Only frames matching the specified count are used for GIF generation
+  - Reusable build artifacts (precompiled preamble, pre-rendered static layer
+    PDFs with their .center files, rendered frame PNGs keyed by a hash of
+    their LaTeX source) are cached in TEX_DIR/.frame_cache/ across runs;
+    use --no-cache to bypass it
         """
     )
     parser.add_argument(
@@ -577,6 +1462,18 @@ Directory handling:
         default=None,
         help='Output directory for frames and GIF (default: timestamped directory under TEX_DIR)'
     )
+    parser.add_argument(
+        '--work-dir',
+        type=str,
+        default=None,
+        help='Directory for intermediate files (default: temporary directory on /dev/shm, else output-dir)'
+    )
+    parser.add_argument(
+        '--keep-intermediates',
+        action='store_true',
+        help='Keep intermediate files for debugging: write them to the output directory '
+             'instead of /dev/shm (unless --work-dir is given) and skip the cleanup prompt'
+    )
     parser.add_argument(
         '--output',
         type=str,
@@ -590,10 +1487,18 @@ Directory handling:
         help='Animation speed multiplier (default: 1.0, use 2.0 for 2x faster, 0.5 for 2x slower)'
     )
     parser.add_argument(
-        '--density',
+        '--render-dpi', '--density',
+        dest='density',
+        type=int,
+        default=DENSITY,
+        help=f'Resolution/DPI for rasterizing frames (default: {DENSITY}, use 300 for print quality). '
+             'Rasterization cost grows with the square of the DPI'
+    )
+    parser.add_argument(
+        '--gif-width',
         type=int,
-        default=300,
-        help='Resolution/DPI for PNG frames and GIF (default: 300, higher = better quality but larger files)'
+        default=None,
+        help='Resize the GIF to this width in pixels (default: keep the rendered size)'
     )
     parser.add_argument(
         '--scale',
@@ -601,6 +1506,24 @@ Directory handling:
         default=1.0,
         help='Scale factor for output size (default: 1.0, use 0.5 for 50%% size, 2.0 for 200%% size)'
     )
+    parser.add_argument(
+        '--engine',
+        choices=LATEX_ENGINES,
+        default='pdflatex',
+        help='LaTeX engine for compiling frames (default: pdflatex; lualatex evaluates pgfmath in Lua)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not reuse or store build artifacts (preamble format, static layers, '
+             'frame PNGs) in TEX_DIR/.frame_cache'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=positive_int,
+        default=None,
+        help='Number of frames to compile in parallel (default: number of CPUs)'
+    )
     
     args = parser.parse_args()
     
@@ -625,20 +1548,43 @@ Directory handling:
     print("=" * 60)
     print("TikZ Pipeline GIF Generator")
     print("=" * 60)
-    print(f"Frames: {args.frames}, FPS: {args.fps}, Speed: {args.speed}x, Density: {args.density} DPI, Scale: {args.scale}x")
+    print(f"Frames: {args.frames}, FPS: {args.fps}, Speed: {args.speed}x, Density: {args.density} DPI, Scale: {args.scale}x, Engine: {args.engine}")
     print(f"Output directory: {output_dir}")
     print(f"Output GIF: {output_gif}")
     print("=" * 60)
     
     # Check dependencies
-    check_dependencies()
+    tools = check_dependencies(args.engine)
+    
+    # Intermediate files (.tex, .aux, .log, .pdf) go to a RAM-backed tmpfs when
+    # available; only the finished PNGs are moved to the output directory
+    temp_work_dir = None
+    if args.work_dir:
+        work_dir = Path(args.work_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+    elif Path('/dev/shm').is_dir() and not args.keep_intermediates:
+        work_dir = temp_work_dir = Path(tempfile.mkdtemp(prefix='pipeline_frames_', dir='/dev/shm'))
+    else:
+        work_dir = output_dir
+    print(f"Work directory: {work_dir}")
     
-    # Generate frames
-    print(f"\nGenerating {args.frames} frames...")
-    success_count = 0
-    for i in range(args.frames):
-        if compile_frame(i, args.frames, output_dir, args.speed, args.density, args.scale):
-            success_count += 1
+    try:
+        compiled = generate_frames(args, work_dir, tools)
+        produced = []
+        for i in compiled:
+            png_file = work_dir / f"frame_{i:04d}.png"
+            if not png_file.exists():
+                print(f"WARNING: {png_file.name} was not produced; leaving frame {i + 1} out")
+                continue
+            if work_dir != output_dir:
+                shutil.move(str(png_file), str(output_dir / png_file.name))
+            produced.append(i)
+        compiled = produced
+    finally:
+        if temp_work_dir:
+            shutil.rmtree(temp_work_dir, ignore_errors=True)
+    
+    success_count = len(compiled)
     
     if success_count != args.frames:
         print(f"\nWARNING: Only {success_count}/{args.frames} frames generated successfully")
@@ -647,19 +1593,20 @@ Directory handling:
             return
     
     # Create GIF
-    if create_gif(args.frames, output_gif, args.fps, output_dir):
+    if create_gif(args.frames, output_gif, args.fps, output_dir, tools, args.gif_width):
         print("\n" + "=" * 60)
         print("SUCCESS! Animated GIF created.")
         print(f"Output: {output_gif}")
         print("=" * 60)
         
-        # Optionally cleanup
-        try:
-            response = input("\nClean up intermediate files? (y/n): ").strip().lower()
-            if response == 'y':
-                cleanup(output_dir)
-        except:
-            pass
+        # Optionally cleanup (a temporary tmpfs work directory is already gone)
+        if temp_work_dir is None and not args.keep_intermediates:
+            try:
+                response = input("\nClean up intermediate files? (y/n): ").strip().lower()
+                if response == 'y':
+                    cleanup(work_dir)
+            except:
+                pass
     else:
         print("\nERROR: Failed to create GIF")
 